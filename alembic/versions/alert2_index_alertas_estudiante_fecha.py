@@ -0,0 +1,35 @@
+"""index alertas by estudiante and fecha_creacion
+
+Revision ID: alert2
+Revises: alert1
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "alert2"
+down_revision = "alert1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_alertas_estudiante_fecha",
+            "Alertas",
+            ["id_estudiante", sa.text("fecha_creacion DESC")],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_alertas_estudiante_fecha",
+            table_name="Alertas",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,45 @@
+"""composite indexes on mensajes for pagination and unread counts
+
+Revision ID: chat1
+Revises: alert2
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "chat1"
+down_revision = "alert2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_mensajes_conv_created",
+            "Mensajes",
+            ["id_conversacion", "created_at"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_mensajes_conv_rcv_unread",
+            "Mensajes",
+            ["id_conversacion", "id_receiver", "is_read"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_mensajes_conv_rcv_unread",
+            table_name="Mensajes",
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_mensajes_conv_created",
+            table_name="Mensajes",
+            postgresql_concurrently=True,
+        )
@@ -0,0 +1,53 @@
+"""denormalized unread counters on conversaciones
+
+Revision ID: chat2
+Revises: chat1
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "chat2"
+down_revision = "chat1"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "Conversaciones",
+        sa.Column(
+            "unread_admin_count", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+    op.add_column(
+        "Conversaciones",
+        sa.Column(
+            "unread_psicologo_count", sa.Integer(), nullable=False, server_default="0"
+        ),
+    )
+    # Backfill from the messages that are currently unread
+    op.execute(
+        """
+        UPDATE "Conversaciones" AS c SET
+            unread_admin_count = (
+                SELECT count(*) FROM "Mensajes" AS m
+                WHERE m.id_conversacion = c.id_conversacion
+                  AND m.id_receiver = c.id_admin
+                  AND NOT m.is_read
+            ),
+            unread_psicologo_count = (
+                SELECT count(*) FROM "Mensajes" AS m
+                WHERE m.id_conversacion = c.id_conversacion
+                  AND m.id_receiver = c.id_psicologo
+                  AND NOT m.is_read
+            )
+        """
+    )
+
+
+def downgrade():
+    op.drop_column("Conversaciones", "unread_psicologo_count")
+    op.drop_column("Conversaciones", "unread_admin_count")
@@ -0,0 +1,63 @@
+"""partial unread index on mensajes, drop indexes nothing reads
+
+Revision ID: chat3
+Revises: chat2
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "chat3"
+down_revision = "chat2"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_mensajes_conv_rcv_unread_partial",
+            "Mensajes",
+            ["id_conversacion", "id_receiver"],
+            postgresql_where=sa.text("is_read = false"),
+            postgresql_concurrently=True,
+        )
+        # Unread counts live on Conversaciones now; mark-as-read only touches
+        # unread rows, which the partial index above covers
+        op.drop_index(
+            "ix_mensajes_conv_rcv_unread",
+            table_name="Mensajes",
+            postgresql_concurrently=True,
+        )
+        # Redundant prefix of ix_mensajes_conv_created
+        op.drop_index(
+            "ix_Mensajes_id_conversacion",
+            table_name="Mensajes",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_Mensajes_id_conversacion",
+            "Mensajes",
+            ["id_conversacion"],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_mensajes_conv_rcv_unread",
+            "Mensajes",
+            ["id_conversacion", "id_receiver", "is_read"],
+            postgresql_concurrently=True,
+        )
+        op.drop_index(
+            "ix_mensajes_conv_rcv_unread_partial",
+            table_name="Mensajes",
+            postgresql_concurrently=True,
+        )
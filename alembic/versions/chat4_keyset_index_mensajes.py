@@ -0,0 +1,38 @@
+"""add id_mensaje to the mensajes pagination index for keyset paging
+
+Revision ID: chat4
+Revises: chat3
+Create Date: 2026-10-15
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "chat4"
+down_revision = "chat3"
+branch_labels = None
+depends_on = None
+
+
+def _recreate(columns):
+    # CONCURRENTLY cannot run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_mensajes_conv_created",
+            table_name="Mensajes",
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_mensajes_conv_created",
+            "Mensajes",
+            columns,
+            postgresql_concurrently=True,
+        )
+
+
+def upgrade():
+    _recreate(["id_conversacion", "created_at", "id_mensaje"])
+
+
+def downgrade():
+    _recreate(["id_conversacion", "created_at"])
@@ -1,21 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+import json
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import insert
 from sqlalchemy.future import select
 from typing import List
 
 from app.core.deps import get_db
 from app.models.alerta import Alerta
 from app.models.users import User
-from app.models.roles import Role
 from app.models.notificacion import Notificacion
 from app.schemas.alerta import AlertaCreate, AlertaRead
 from app.schemas.notificacion import NotificacionRead
 from app.core.ws import manager
+from app.core.role_cache import get_role_id
 
-FILTER_LINES = [
+FILTER_LINES = (
     "análisis de ia",
     "mensaje bloqueado por filtro de contenido de azure",
-]
+)
+_FILTER_RE = re.compile("|".join(map(re.escape, FILTER_LINES)), re.IGNORECASE)
 
 
 def _sanitize_alert_text(raw: str) -> str:
@@ -27,11 +33,7 @@ def _sanitize_alert_text(raw: str) -> str:
     """
     if not raw:
         return raw
-    lines = [
-        ln
-        for ln in raw.splitlines()
-        if not any(key in ln.lower() for key in FILTER_LINES)
-    ]
+    lines = [ln for ln in raw.splitlines() if not _FILTER_RE.search(ln)]
     return "\n".join(lines).strip()
 
 
@@ -55,18 +57,31 @@ async def crear_alerta(alert_in: AlertaCreate, db: AsyncSession = Depends(get_db
     await db.commit()
     await db.refresh(alerta)
 
+    # Find ADMIN and PSICOLOGO users
+    admin_role_id = await get_role_id(db, "ADMINISTRADOR")
+    psicologo_role_id = await get_role_id(db, "PSICOLOGO")
+    role_ids = [r for r in (admin_role_id, psicologo_role_id) if r is not None]
+    if not role_ids:
+        return alerta
+    res_targets = await db.execute(
+        select(User.id_usuario).where(User.id_rol.in_(role_ids))
+    )
+    target_ids = set(res_targets.scalars().all())
+    if not target_ids:
+        return alerta
+
     # Build human-readable info for notifications
     estudiante_nombre = f"{getattr(estudiante, 'nombre', '')} {getattr(estudiante, 'apellido', '')}".strip()
-    # Extract just the original message if texto contains JSON
-    texto_preview = alerta.texto
-    try:
-        import json
-
-        texto_data = json.loads(alerta.texto)
+    # Extract just the original message if texto contains JSON; plain text is
+    # the common case, so only attempt to parse when it looks like an object
+    texto_preview = sanitized_text
+    if sanitized_text.lstrip().startswith("{"):
+        try:
+            texto_data = json.loads(sanitized_text)
+        except ValueError:
+            texto_data = None
         if isinstance(texto_data, dict) and "mensaje_original" in texto_data:
             texto_preview = _sanitize_alert_text(texto_data["mensaje_original"])
-    except (json.JSONDecodeError, ValueError):
-        texto_preview = _sanitize_alert_text(texto_preview)
 
     titulo_base = (
         f"ALERTA {alerta.severidad}: {estudiante_nombre} ({estudiante.email}) - "
@@ -75,63 +90,63 @@ async def crear_alerta(alert_in: AlertaCreate, db: AsyncSession = Depends(get_db
         :255
     ]  # Ensure it fits in DB column limit
 
-    # Find ADMIN and PSICOLOGO users
-    res_roles = await db.execute(select(Role))
-    roles = {r.nombre_rol: r.id_rol for r in res_roles.scalars().all()}
-    admin_role_id = roles.get("ADMINISTRADOR")
-    psicologo_role_id = roles.get("PSICOLOGO")
-
-    target_users: List[int] = []
-    if admin_role_id:
-        res_admins = await db.execute(select(User).where(User.id_rol == admin_role_id))
-        target_users.extend([u.id_usuario for u in res_admins.scalars().all()])
-    if psicologo_role_id:
-        res_psis = await db.execute(
-            select(User).where(User.id_rol == psicologo_role_id)
-        )
-        target_users.extend([u.id_usuario for u in res_psis.scalars().all()])
-
-    # Create Notificaciones for each target
-    for uid in set(target_users):
-        n = Notificacion(
-            id_estudiante=alerta.id_estudiante,
-            id_psicologo=uid,
-            titulo=titulo_base,
-        )
-        db.add(n)
-        await db.commit()
-        await db.refresh(n)
+    # Create Notificaciones for every target in a single INSERT ... RETURNING
+    res_notis = await db.scalars(
+        insert(Notificacion).returning(Notificacion),
+        [
+            {
+                "id_estudiante": alerta.id_estudiante,
+                "id_psicologo": uid,
+                "titulo": titulo_base,
+            }
+            for uid in target_ids
+        ],
+    )
+    notis = res_notis.all()
+    await db.commit()
+
+    # Extra event for specialized UIs if needed; identical for every target
+    alerta_event = {
+        "type": "alerta_nueva",
+        "data": {
+            "id_alerta": alerta.id_alerta,
+            "id_estudiante": alerta.id_estudiante,
+            "texto": alerta.texto,
+            "severidad": alerta.severidad,
+            "fecha_creacion": str(alerta.fecha_creacion),
+            "estudiante_nombre": estudiante_nombre,
+            "estudiante_email": estudiante.email,
+        },
+    }
+
+    async def _push(n: Notificacion):
         # Standard notification push so existing panels update
         await manager.send_to_user(
-            uid,
+            n.id_psicologo,
             {
                 "type": "notification_new",
                 "data": NotificacionRead.from_orm(n).model_dump(),
             },
         )
-        # Extra event for specialized UIs if needed
-        await manager.send_to_user(
-            uid,
-            {
-                "type": "alerta_nueva",
-                "data": {
-                    "id_alerta": alerta.id_alerta,
-                    "id_estudiante": alerta.id_estudiante,
-                    "texto": alerta.texto,
-                    "severidad": alerta.severidad,
-                    "fecha_creacion": str(alerta.fecha_creacion),
-                    "estudiante_nombre": estudiante_nombre,
-                    "estudiante_email": estudiante.email,
-                },
-            },
-        )
+        await manager.send_to_user(n.id_psicologo, alerta_event)
+
+    await asyncio.gather(*(_push(n) for n in notis))
 
     return alerta
 
 
 @router.get("/", response_model=list[AlertaRead])
-async def listar_alertas(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(Alerta).order_by(Alerta.fecha_creacion.desc()))
+async def listar_alertas(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    res = await db.execute(
+        select(Alerta)
+        .order_by(Alerta.fecha_creacion.desc())
+        .offset(skip)
+        .limit(limit)
+    )
     return res.scalars().all()
 
 
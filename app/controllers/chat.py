@@ -1,4 +1,7 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import orjson
 from fastapi import (
     APIRouter,
     Depends,
@@ -10,12 +13,12 @@ from fastapi import (
 )
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from jose import jwt, JWTError
+from jose import JWTError
 
+from app.core.database import AsyncSessionLocal
 from app.core.deps import get_db
 from app.core.security import get_current_user
 from app.core.ws_chat import chat_manager
-from app.core.config import settings
 from app.models.users import User
 from app.models.roles import Role
 from app.schemas.chat import (
@@ -26,121 +29,117 @@ from app.schemas.chat import (
     ChatMessageRead,
 )
 from app.services import chat as chat_service
+from app.utils.auth import decode_user_id
 
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+async def get_user_with_role(db: AsyncSession, user_id: int) -> Tuple[int, str]:
+    """Get (id_usuario, nombre_rol) for a user"""
+    stmt = (
+        select(User.id_usuario, Role.nombre_rol)
+        .join(Role, User.id_rol == Role.id_rol)
+        .where(User.id_usuario == user_id)
+    )
+    result = await db.execute(stmt)
+    row = result.one_or_none()
+    if not row:
+        raise HTTPException(status_code=404, detail="User not found")
+    return row[0], row[1]
+
+
+async def get_current_user_with_role(
+    current_user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+) -> Tuple[int, str]:
+    """Dependency: (id_usuario, nombre_rol) of the authenticated user.
+
+    FastAPI caches dependencies per request, so the lookup runs at most once.
+    """
+    return await get_user_with_role(db, int(current_user_id))
+
+
+def get_conversation_cache() -> dict:
+    """Dependency: empty per-request cache of conversation rows by id"""
+    return {}
+
+
 @router.get("/psicologos", response_model=List[dict])
 async def list_psicologos(
-    current_user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    current: Tuple[int, str] = Depends(get_current_user_with_role),
+    db: AsyncSession = Depends(get_db),
 ):
     """List all psychologists for admin to start conversations"""
-    user_id = int(current_user_id)
-    user, role = await get_user_with_role(db, user_id)
+    _, role_name = current
 
     # Only admin can list psychologists
-    if role.nombre_rol != "ADMINISTRADOR":
+    if role_name != "ADMINISTRADOR":
         raise HTTPException(status_code=403, detail="Only admin can list psychologists")
 
     # Get all psychologists
-    stmt = (
-        select(User, Role)
-        .join(Role, User.id_rol == Role.id_rol)
-        .where(Role.nombre_rol == "PSICOLOGO")
-    )
-    result = await db.execute(stmt)
-    rows = result.all()
-
-    psicologos = []
-    for user, role in rows:
-        psicologos.append(
-            {
-                "id_usuario": user.id_usuario,
-                "nombre": user.nombre,
-                "apellido": user.apellido,
-                "email": user.email,
-            }
-        )
-
-    return psicologos
+    return await _list_users_with_role(db, "PSICOLOGO")
 
 
 @router.get("/admins", response_model=List[dict])
 async def list_admins(
-    current_user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    current: Tuple[int, str] = Depends(get_current_user_with_role),
+    db: AsyncSession = Depends(get_db),
 ):
     """List all admins for psychologist to start conversations"""
-    user_id = int(current_user_id)
-    user, role = await get_user_with_role(db, user_id)
+    _, role_name = current
 
     # Only psychologist can list admins
-    if role.nombre_rol != "PSICOLOGO":
+    if role_name != "PSICOLOGO":
         raise HTTPException(status_code=403, detail="Only psychologist can list admins")
 
     # Get all admins
-    stmt = (
-        select(User, Role)
-        .join(Role, User.id_rol == Role.id_rol)
-        .where(Role.nombre_rol == "ADMINISTRADOR")
-    )
-    result = await db.execute(stmt)
-    rows = result.all()
-
-    admins = []
-    for user, role in rows:
-        admins.append(
-            {
-                "id_usuario": user.id_usuario,
-                "nombre": user.nombre,
-                "apellido": user.apellido,
-                "email": user.email,
-            }
-        )
-
-    return admins
+    return await _list_users_with_role(db, "ADMINISTRADOR")
 
 
-async def get_user_with_role(db: AsyncSession, user_id: int):
-    """Get user with role information"""
+async def _list_users_with_role(db: AsyncSession, nombre_rol: str) -> List[dict]:
+    """List the public fields of every user with the given role"""
     stmt = (
-        select(User, Role)
+        select(User.id_usuario, User.nombre, User.apellido, User.email)
         .join(Role, User.id_rol == Role.id_rol)
-        .where(User.id_usuario == user_id)
+        .where(Role.nombre_rol == nombre_rol)
     )
     result = await db.execute(stmt)
-    row = result.one_or_none()
-    if not row:
-        raise HTTPException(status_code=404, detail="User not found")
-    return row[0], row[1]
+    return [
+        {
+            "id_usuario": id_usuario,
+            "nombre": nombre,
+            "apellido": apellido,
+            "email": email,
+        }
+        for id_usuario, nombre, apellido, email in result.all()
+    ]
 
 
 @router.post("/conversations", response_model=ConversationRead)
 async def create_or_get_conversation(
     data: ConversationCreate,
-    current_user_id: str = Depends(get_current_user),
+    current: Tuple[int, str] = Depends(get_current_user_with_role),
     db: AsyncSession = Depends(get_db),
 ):
     """Create or get existing conversation between admin and psicologo"""
-    user_id = int(current_user_id)
-    user, role = await get_user_with_role(db, user_id)
+    user_id, role_name = current
 
     admin_id = None
     psicologo_id = None
 
-    if role.nombre_rol == "ADMINISTRADOR":
+    if role_name == "ADMINISTRADOR":
         # Admin creating conversation with psicologo
         admin_id = user_id
         psicologo_id = data.id_psicologo
 
         # Verify psicologo exists and has correct role
-        psicologo, psicologo_role = await get_user_with_role(db, data.id_psicologo)
-        if psicologo_role.nombre_rol != "PSICOLOGO":
+        _, psicologo_role = await get_user_with_role(db, data.id_psicologo)
+        if psicologo_role != "PSICOLOGO":
             raise HTTPException(
                 status_code=400, detail="Target user must be a psicologo"
             )
 
-    elif role.nombre_rol == "PSICOLOGO":
+    elif role_name == "PSICOLOGO":
         # Psicologo creating conversation with admin
         psicologo_id = user_id
         admin_id = (
@@ -148,8 +147,8 @@ async def create_or_get_conversation(
         )  # In this case, id_psicologo field contains admin_id
 
         # Verify admin exists and has correct role
-        admin, admin_role = await get_user_with_role(db, data.id_psicologo)
-        if admin_role.nombre_rol != "ADMINISTRADOR":
+        _, admin_role = await get_user_with_role(db, data.id_psicologo)
+        if admin_role != "ADMINISTRADOR":
             raise HTTPException(status_code=400, detail="Target user must be an admin")
 
     else:
@@ -157,44 +156,47 @@ async def create_or_get_conversation(
             status_code=403, detail="Only admin or psicologo can create conversations"
         )
 
-    conversation = await chat_service.get_or_create_conversation(
-        db=db, admin_id=admin_id, psicologo_id=psicologo_id
-    )
+    try:
+        conversation = await chat_service.get_or_create_conversation(
+            db=db, admin_id=admin_id, psicologo_id=psicologo_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
     return conversation
 
 
 @router.get("/conversations", response_model=List[ConversationWithDetails])
 async def list_conversations(
-    current_user_id: str = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    current: Tuple[int, str] = Depends(get_current_user_with_role),
+    db: AsyncSession = Depends(get_db),
 ):
     """List all conversations for current user"""
-    user_id = int(current_user_id)
-    user, role = await get_user_with_role(db, user_id)
+    user_id, role_name = current
 
-    is_admin = role.nombre_rol == "ADMINISTRADOR"
+    is_admin = role_name == "ADMINISTRADOR"
 
     conversations_data = await chat_service.list_conversations_for_user(
         db=db, user_id=user_id, is_admin=is_admin
     )
 
-    # Build response with details
-    result = []
-    for conversation, participant_name, unread_count in conversations_data:
-        result.append(
-            ConversationWithDetails(
-                id_conversacion=conversation.id_conversacion,
-                id_admin=conversation.id_admin,
-                id_psicologo=conversation.id_psicologo,
-                created_at=conversation.created_at,
-                updated_at=conversation.updated_at,
-                last_message_at=conversation.last_message_at,
-                last_message_text=conversation.last_message_text,
-                admin_nombre=participant_name if not is_admin else None,
-                psicologo_nombre=participant_name if is_admin else None,
-                unread_count=unread_count,
-            )
-        )
+    # Build response with details; plain dicts let response_model serialize
+    # them like every other chat endpoint (same datetime format)
+    result = [
+        {
+            "id_conversacion": row.id_conversacion,
+            "id_admin": row.id_admin,
+            "id_psicologo": row.id_psicologo,
+            "created_at": row.created_at,
+            "updated_at": row.updated_at,
+            "last_message_at": row.last_message_at,
+            "last_message_text": row.last_message_text,
+            "admin_nombre": row.participant_name if not is_admin else None,
+            "psicologo_nombre": row.participant_name if is_admin else None,
+            "unread_count": row.unread_count,
+        }
+        for row in conversations_data
+    ]
 
     return result
 
@@ -204,12 +206,22 @@ async def list_conversations(
 )
 async def get_messages(
     conversation_id: int,
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    latest: bool = False,
     current_user_id: str = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
-    """Get messages in a conversation"""
+    """Get messages in a conversation, oldest first.
+
+    Without paging parameters (or with skip) returns the oldest messages.
+    To load recent history, request latest=true for the newest `limit`
+    messages, then pass the created_at/id_mensaje of the oldest loaded
+    message as before/before_id to page back. skip cannot be combined with
+    latest or before/before_id.
+    """
     user_id = int(current_user_id)
 
     # Verify user is participant
@@ -222,8 +234,23 @@ async def get_messages(
             status_code=403, detail="Not authorized to view this conversation"
         )
 
+    if (before is None) != (before_id is None):
+        raise HTTPException(
+            status_code=400, detail="before and before_id must be given together"
+        )
+    if skip and (latest or before is not None):
+        raise HTTPException(
+            status_code=400, detail="skip cannot be combined with latest or before"
+        )
+
     messages = await chat_service.list_messages(
-        db=db, conversation_id=conversation_id, skip=skip, limit=limit
+        db=db,
+        conversation_id=conversation_id,
+        skip=skip,
+        limit=limit,
+        before=before,
+        before_id=before_id,
+        latest=latest,
     )
 
     return messages
@@ -263,10 +290,9 @@ async def send_message(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Broadcast to WebSocket connections
-    await chat_manager.broadcast(
-        conversation_id=conversation_id,
-        message={
+    # Broadcast to WebSocket connections (serialized once for every recipient)
+    payload = orjson.dumps(
+        {
             "type": "new_message",
             "message": {
                 "id_mensaje": message.id_mensaje,
@@ -277,8 +303,9 @@ async def send_message(
                 "created_at": message.created_at.isoformat(),
                 "is_read": message.is_read,
             },
-        },
-    )
+        }
+    ).decode()
+    await chat_manager.broadcast(conversation_id=conversation_id, message=payload)
 
     return message
 
@@ -288,23 +315,30 @@ async def mark_as_read(
     conversation_id: int,
     current_user_id: str = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
+    conversation_cache: dict = Depends(get_conversation_cache),
 ):
     """Mark all messages in conversation as read"""
     user_id = int(current_user_id)
 
     # Verify user is participant
     is_participant = await chat_service.is_user_in_conversation(
-        db=db, conversation_id=conversation_id, user_id=user_id
+        db=db,
+        conversation_id=conversation_id,
+        user_id=user_id,
+        conversation_cache=conversation_cache,
     )
 
     if not is_participant:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    count = await chat_service.mark_messages_as_read(
-        db=db, conversation_id=conversation_id, user_id=user_id
+    message_ids = await chat_service.mark_messages_as_read(
+        db=db,
+        conversation_id=conversation_id,
+        user_id=user_id,
+        conversation_cache=conversation_cache,
     )
 
-    return {"marked_read": count}
+    return {"marked_read": len(message_ids), "message_ids": message_ids}
 
 
 @router.websocket("/ws/{conversation_id}")
@@ -312,43 +346,34 @@ async def websocket_chat(
     websocket: WebSocket, conversation_id: int, token: str = Query(...)
 ):
     """WebSocket endpoint for real-time chat"""
-    # Accept connection first
+    # Accept early to avoid 403 during handshake; close with custom code on
+    # failure. Nothing is registered with chat_manager until both checks pass.
     await websocket.accept()
 
-    # Authenticate
     try:
-        payload = jwt.decode(
-            token, settings.secret_key, algorithms=[settings.algorithm]
-        )
-        sub = payload.get("sub")
-        if sub is None:
-            raise JWTError("Missing sub")
-        user_id = int(sub)
+        user_id = decode_user_id(token)
     except (JWTError, ValueError, TypeError):
         await websocket.close(code=4401)
         return
 
     # Verify user is participant
-    from app.core.database import AsyncSessionLocal
-
     async with AsyncSessionLocal() as db:
         is_participant = await chat_service.is_user_in_conversation(
             db=db, conversation_id=conversation_id, user_id=user_id
         )
 
-        if not is_participant:
-            await websocket.close(code=4403)
-            return
+    if not is_participant:
+        await websocket.close(code=4403)
+        return
 
     # Connect to chat
     await chat_manager.connect(conversation_id, websocket)
 
     try:
         while True:
-            # Keep connection open; receive pings
-            data = await websocket.receive_text()
-            # Echo pong
-            if data == "ping":
-                await websocket.send_json({"type": "pong"})
+            # Keep connection open; liveness is handled by the server's
+            # protocol-level ping frames (uvicorn --ws-ping-interval), so
+            # incoming client messages need no reply
+            await websocket.receive_text()
     except WebSocketDisconnect:
         chat_manager.disconnect(conversation_id, websocket)
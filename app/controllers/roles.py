@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.core import role_cache
 from app.core.deps import get_db
 from app.models.roles import Role
 from app.schemas.roles import RoleCreate, RoleRead
@@ -15,6 +16,7 @@ async def create_role(role_in: RoleCreate, db: AsyncSession = Depends(get_db)):
     db.add(db_role)
     await db.commit()
     await db.refresh(db_role)
+    role_cache.clear()
     return db_role
 
 
@@ -41,3 +43,4 @@ async def delete_role(role_id: int, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Role not found")
     await db.delete(role)
     await db.commit()
+    role_cache.clear()
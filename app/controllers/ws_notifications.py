@@ -1,28 +1,22 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from jose import jwt, JWTError
+from jose import JWTError
+from sqlalchemy import func
 from sqlalchemy.future import select
 
 from app.core.ws import manager
 from app.models.notificacion import Notificacion
-from app.core.config import settings
+from app.utils.auth import decode_user_id
 
 
 router = APIRouter()
 
-SECRET_KEY = settings.secret_key
-ALGORITHM = settings.algorithm
-
 
 @router.websocket("/ws/notifications")
 async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
     # Accept early to avoid 403 during handshake; close with custom code on failure
     await websocket.accept()
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        sub = payload.get("sub")
-        if sub is None:
-            raise JWTError("Missing sub")
-        user_id = int(sub)
+        user_id = decode_user_id(token)
     except (JWTError, ValueError, TypeError):
         await websocket.close(code=4401)
         return
@@ -36,7 +30,9 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
 
         async with AsyncSessionLocal() as db:
             result = await db.execute(
-                select(Notificacion).where(
+                select(func.count())
+                .select_from(Notificacion)
+                .where(
                     (
                         (Notificacion.id_estudiante == user_id)
                         | (Notificacion.id_psicologo == user_id)
@@ -44,7 +40,7 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
                     & (Notificacion.leida == False)  # noqa: E712
                 )
             )
-            unread_count = len(result.scalars().all())
+            unread_count = result.scalar_one()
             await websocket.send_json({"type": "unread_count", "count": unread_count})
     except Exception:  # noqa: BLE001 - keep connection open on failure
         # Don't terminate connection on initial count failure
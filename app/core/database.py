@@ -23,6 +23,8 @@ try:
         # Added parameters for better connection management
         pool_pre_ping=True,
         pool_recycle=300,
+        # Room for every distinct statement shape so compiled SQL is reused
+        query_cache_size=1200,
     )
     print("Engine created successfully")
 except Exception as e:
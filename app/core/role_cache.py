@@ -0,0 +1,38 @@
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models.roles import Role
+
+# Roles are seeded at startup and almost never change, so a short process-local
+# cache saves a round-trip on hot paths. Role mutations must call clear().
+ROLE_CACHE_TTL = 300  # seconds
+
+_cache: Dict[str, Tuple[int, float]] = {}
+_lock = asyncio.Lock()
+
+
+async def get_role_id(db: AsyncSession, name: str) -> Optional[int]:
+    """Return id_rol for a role name, or None if the role does not exist"""
+    entry = _cache.get(name)
+    if entry and entry[1] > time.monotonic():
+        return entry[0]
+
+    async with _lock:
+        entry = _cache.get(name)
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        result = await db.execute(select(Role.id_rol).where(Role.nombre_rol == name))
+        role_id = result.scalar_one_or_none()
+        # Missing roles are not cached so a later seed is picked up immediately
+        if role_id is not None:
+            _cache[name] = (role_id, time.monotonic() + ROLE_CACHE_TTL)
+        return role_id
+
+
+def clear() -> None:
+    """Invalidate cached role ids (call after any Role write)"""
+    _cache.clear()
@@ -1,17 +1,24 @@
-from typing import Dict, Set
+import asyncio
+import json
+from typing import Dict, List, Union
 from fastapi import WebSocket
 
+# Max concurrent sends per broadcast before yielding to the event loop
+BROADCAST_BATCH_SIZE = 50
+
 
 class ChatConnectionManager:
     """Manager for chat WebSocket connections per conversation"""
 
     def __init__(self) -> None:
-        # conversation_id -> set of websockets
-        self.active_connections: Dict[int, Set[WebSocket]] = {}
+        # conversation_id -> list of websockets
+        self.active_connections: Dict[int, List[WebSocket]] = {}
 
     async def connect(self, conversation_id: int, websocket: WebSocket):
         """Connect websocket to a conversation"""
-        self.active_connections.setdefault(conversation_id, set()).add(websocket)
+        conns = self.active_connections.setdefault(conversation_id, [])
+        if websocket not in conns:
+            conns.append(websocket)
 
     def disconnect(self, conversation_id: int, websocket: WebSocket):
         """Disconnect websocket from a conversation"""
@@ -23,17 +30,31 @@ class ChatConnectionManager:
         if not conns:
             self.active_connections.pop(conversation_id, None)
 
-    async def broadcast(self, conversation_id: int, message: dict):
-        """Broadcast message to all connections in a conversation"""
-        conns = self.active_connections.get(conversation_id, set())
-        to_remove: Set[WebSocket] = set()
-        for ws in conns:
-            try:
-                await ws.send_json(message)
-            except Exception:
-                to_remove.add(ws)
-        for ws in to_remove:
-            self.disconnect(conversation_id, ws)
+    async def broadcast(self, conversation_id: int, message: Union[dict, str]):
+        """Broadcast message to all connections in a conversation.
+
+        ``message`` may be a dict or an already serialized JSON string.
+        """
+        # Copy: failed sends remove sockets from the live list while we iterate
+        conns = list(self.active_connections.get(conversation_id, ()))
+        if not conns:
+            return
+        # Serialize once (same encoding as send_json) and send concurrently
+        if isinstance(message, str):
+            payload = message
+        else:
+            payload = json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+        for start in range(0, len(conns), BROADCAST_BATCH_SIZE):
+            batch = conns[start : start + BROADCAST_BATCH_SIZE]
+            results = await asyncio.gather(
+                *(ws.send_text(payload) for ws in batch), return_exceptions=True
+            )
+            for ws, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    self.disconnect(conversation_id, ws)
+            if start + BROADCAST_BATCH_SIZE < len(conns):
+                # Let other connections run between large fan-out batches
+                await asyncio.sleep(0)
 
 
 chat_manager = ChatConnectionManager()
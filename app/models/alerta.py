@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, text
 
 from .base import Base
 
@@ -10,3 +10,8 @@ class Alerta(Base):
     texto = Column(String, nullable=False)
     severidad = Column(String(20), nullable=False, default="ALTA")
     fecha_creacion = Column(DateTime(timezone=True), server_default=text("now()"))
+
+    __table_args__ = (
+        # Serves per-student listings ordered by newest first
+        Index("ix_alertas_estudiante_fecha", id_estudiante, fecha_creacion.desc()),
+    )
@@ -6,10 +6,11 @@ from sqlalchemy import (
     Boolean,
     Text,
     ForeignKey,
+    Index,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 from .base import Base
 
@@ -41,6 +42,11 @@ class ChatConversation(Base):
     )
     last_message_at = Column(DateTime(timezone=True), nullable=True)
     last_message_text = Column(String(500), nullable=True)
+    # Denormalized unread counters, maintained by the chat service
+    unread_admin_count = Column(Integer, default=0, server_default="0", nullable=False)
+    unread_psicologo_count = Column(
+        Integer, default=0, server_default="0", nullable=False
+    )
 
     __table_args__ = (
         UniqueConstraint("id_admin", "id_psicologo", name="uq_admin_psicologo"),
@@ -62,7 +68,6 @@ class ChatMessage(Base):
         Integer,
         ForeignKey("Conversaciones.id_conversacion", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
     id_sender = Column(
         Integer, ForeignKey("Usuarios.id_usuario", ondelete="CASCADE"), nullable=False
@@ -76,6 +81,20 @@ class ChatMessage(Base):
     )
     is_read = Column(Boolean, default=False, server_default="false", nullable=False)
 
+    __table_args__ = (
+        # Message pagination within a conversation (keyset on created_at, id)
+        Index(
+            "ix_mensajes_conv_created", "id_conversacion", "created_at", "id_mensaje"
+        ),
+        # Only unread rows: small and exactly what mark-as-read updates
+        Index(
+            "ix_mensajes_conv_rcv_unread_partial",
+            "id_conversacion",
+            "id_receiver",
+            postgresql_where=text("is_read = false"),
+        ),
+    )
+
     # Relationships
     conversation = relationship("ChatConversation", back_populates="messages")
     sender = relationship("User", foreign_keys=[id_sender])
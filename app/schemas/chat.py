@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 # Message schemas
@@ -10,7 +10,7 @@ class ChatMessageBase(BaseModel):
 
 class ChatMessageCreate(BaseModel):
     id_receiver: int
-    texto: str
+    texto: str = Field(..., max_length=4000)
 
 
 class ChatMessageRead(BaseModel):
@@ -1,186 +1,362 @@
 from datetime import datetime
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func, desc
-from sqlalchemy.orm import selectinload
+from sqlalchemy import (
+    DateTime,
+    Row,
+    Integer,
+    select,
+    update,
+    and_,
+    or_,
+    bindparam,
+    case,
+    desc,
+    func,
+    insert,
+    literal,
+    tuple_,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import raiseload, selectinload
 
 from app.models.chat import ChatConversation, ChatMessage
 from app.models.users import User
 from app.schemas.chat import ConversationCreate, ChatMessageCreate
 
+# Longest message text stored as the conversation preview (column is 500 chars)
+LAST_MESSAGE_PREVIEW_LENGTH = 240
+
+
+def _message_preview(texto: str) -> str:
+    """Shorten a message for Conversaciones.last_message_text"""
+    if len(texto) > LAST_MESSAGE_PREVIEW_LENGTH:
+        return texto[:LAST_MESSAGE_PREVIEW_LENGTH] + "…"
+    return texto
+
 
 async def get_or_create_conversation(
     db: AsyncSession, admin_id: int, psicologo_id: int
 ) -> ChatConversation:
     """Get existing conversation or create new one between admin and psicologo"""
-    # Check if conversation exists
-    stmt = select(ChatConversation).where(
-        and_(
-            ChatConversation.id_admin == admin_id,
-            ChatConversation.id_psicologo == psicologo_id,
+    # Single race-safe upsert; the no-op DO UPDATE makes RETURNING yield the
+    # existing row on conflict (DO NOTHING would return nothing)
+    stmt = (
+        pg_insert(ChatConversation)
+        .values(id_admin=admin_id, id_psicologo=psicologo_id)
+        .on_conflict_do_update(
+            constraint="uq_admin_psicologo",
+            set_={"id_admin": admin_id},
         )
+        .returning(ChatConversation)
+        .execution_options(populate_existing=True)
     )
-    result = await db.execute(stmt)
-    conversation = result.scalar_one_or_none()
-
-    if conversation:
-        return conversation
-
-    # Create new conversation
-    conversation = ChatConversation(id_admin=admin_id, id_psicologo=psicologo_id)
-    db.add(conversation)
+    try:
+        result = await db.execute(stmt)
+    except IntegrityError:
+        # The only constraints left after ON CONFLICT are the user FKs, so the
+        # statement fails on its own; no prior existence SELECT is needed
+        await db.rollback()
+        raise ValueError("Admin or psicologo user not found")
+    conversation = result.scalars().one()
     await db.commit()
-    await db.refresh(conversation)
     return conversation
 
 
 async def list_conversations_for_user(
     db: AsyncSession, user_id: int, is_admin: bool
-) -> List[Tuple[ChatConversation, str, int]]:
+) -> List[Row]:
     """
     List all conversations for a user with participant names and unread count
-    Returns: List of (conversation, participant_name, unread_count)
+    Returns: rows with the ConversationRead columns plus participant_name and
+    unread_count
     """
     if is_admin:
         # Admin sees conversations with psicologos
-        stmt = (
-            select(
-                ChatConversation,
-                User.nombre,
-                User.apellido,
-                func.count(ChatMessage.id_mensaje)
-                .filter(
-                    and_(
-                        ChatMessage.id_receiver == user_id, ChatMessage.is_read == False
-                    )
-                )
-                .label("unread_count"),
-            )
-            .join(User, ChatConversation.id_psicologo == User.id_usuario)
-            .outerjoin(
-                ChatMessage,
-                ChatConversation.id_conversacion == ChatMessage.id_conversacion,
-            )
-            .where(ChatConversation.id_admin == user_id)
-            .group_by(ChatConversation.id_conversacion, User.nombre, User.apellido)
-            .order_by(desc(ChatConversation.updated_at))
-        )
+        own_column = ChatConversation.id_admin
+        other_column = ChatConversation.id_psicologo
+        unread_column = ChatConversation.unread_admin_count
     else:
         # Psicologo sees conversations with admins
-        stmt = (
-            select(
-                ChatConversation,
-                User.nombre,
-                User.apellido,
-                func.count(ChatMessage.id_mensaje)
-                .filter(
-                    and_(
-                        ChatMessage.id_receiver == user_id, ChatMessage.is_read == False
-                    )
-                )
-                .label("unread_count"),
-            )
-            .join(User, ChatConversation.id_admin == User.id_usuario)
-            .outerjoin(
-                ChatMessage,
-                ChatConversation.id_conversacion == ChatMessage.id_conversacion,
-            )
-            .where(ChatConversation.id_psicologo == user_id)
-            .group_by(ChatConversation.id_conversacion, User.nombre, User.apellido)
-            .order_by(desc(ChatConversation.updated_at))
-        )
+        own_column = ChatConversation.id_psicologo
+        other_column = ChatConversation.id_admin
+        unread_column = ChatConversation.unread_psicologo_count
 
-    result = await db.execute(stmt)
-    rows = result.all()
-
-    conversations_with_details = []
-    for row in rows:
-        conversation = row[0]
-        nombre = row[1]
-        apellido = row[2]
-        unread_count = row[3] if len(row) > 3 else 0
-        participant_name = f"{nombre} {apellido}"
-        conversations_with_details.append(
-            (conversation, participant_name, unread_count)
+    # One round-trip, plain columns only (no ORM entities to build)
+    stmt = (
+        select(
+            ChatConversation.id_conversacion,
+            ChatConversation.id_admin,
+            ChatConversation.id_psicologo,
+            ChatConversation.created_at,
+            ChatConversation.updated_at,
+            ChatConversation.last_message_at,
+            ChatConversation.last_message_text,
+            func.concat_ws(" ", User.nombre, User.apellido).label(
+                "participant_name"
+            ),
+            unread_column.label("unread_count"),
         )
+        .join(User, other_column == User.id_usuario)
+        .where(own_column == user_id)
+        .order_by(desc(ChatConversation.updated_at))
+    )
 
-    return conversations_with_details
+    result = await db.execute(stmt)
+    return result.all()
 
 
 async def get_conversation(
-    db: AsyncSession, conversation_id: int
+    db: AsyncSession,
+    conversation_id: int,
+    *,
+    conversation_cache: Optional[Dict[int, Optional[ChatConversation]]] = None,
 ) -> Optional[ChatConversation]:
-    """Get conversation by ID"""
+    """Get conversation by ID.
+
+    ``conversation_cache`` is an optional per-request dict: when given, the
+    row is loaded at most once per request. Functions that modify the
+    conversation drop their entry from it.
+    """
+    if conversation_cache is not None and conversation_id in conversation_cache:
+        return conversation_cache[conversation_id]
     stmt = select(ChatConversation).where(
         ChatConversation.id_conversacion == conversation_id
     )
     result = await db.execute(stmt)
-    return result.scalar_one_or_none()
+    conversation = result.scalar_one_or_none()
+    if conversation_cache is not None:
+        conversation_cache[conversation_id] = conversation
+    return conversation
 
 
 async def is_user_in_conversation(
-    db: AsyncSession, conversation_id: int, user_id: int
+    db: AsyncSession,
+    conversation_id: int,
+    user_id: int,
+    *,
+    conversation_cache: Optional[Dict[int, Optional[ChatConversation]]] = None,
 ) -> bool:
     """Check if user is participant in conversation"""
-    conversation = await get_conversation(db, conversation_id)
-    if not conversation:
-        return False
-    return conversation.id_admin == user_id or conversation.id_psicologo == user_id
-
+    if conversation_cache is not None:
+        # Load (or reuse) the row so later calls in the request can use it
+        conversation = await get_conversation(
+            db, conversation_id, conversation_cache=conversation_cache
+        )
+        if not conversation:
+            return False
+        return user_id in (conversation.id_admin, conversation.id_psicologo)
 
-async def list_messages(
-    db: AsyncSession, conversation_id: int, skip: int = 0, limit: int = 100
-) -> List[ChatMessage]:
-    """Get messages in a conversation"""
     stmt = (
-        select(ChatMessage)
-        .where(ChatMessage.id_conversacion == conversation_id)
-        .order_by(ChatMessage.created_at.asc())
-        .offset(skip)
-        .limit(limit)
+        select(literal(1))
+        .select_from(ChatConversation)
+        .where(
+            ChatConversation.id_conversacion == conversation_id,
+            or_(
+                ChatConversation.id_admin == user_id,
+                ChatConversation.id_psicologo == user_id,
+            ),
+        )
+        .limit(1)
     )
     result = await db.execute(stmt)
-    return list(result.scalars().all())
+    return result.first() is not None
+
+
+# Built once; every value is a bound parameter so the compiled form is reused
+_LIST_MESSAGES_STMT = (
+    select(ChatMessage)
+    .where(ChatMessage.id_conversacion == bindparam("conversation_id"))
+    .order_by(ChatMessage.created_at.asc())
+    .offset(bindparam("skip", type_=Integer))
+    .limit(bindparam("limit", type_=Integer))
+    .options(raiseload("*"))
+)
+
+# Newest `limit` messages, read backwards from the end of the index
+_LIST_LATEST_MESSAGES_STMT = (
+    select(ChatMessage)
+    .where(ChatMessage.id_conversacion == bindparam("conversation_id"))
+    .order_by(ChatMessage.created_at.desc(), ChatMessage.id_mensaje.desc())
+    .limit(bindparam("limit", type_=Integer))
+    .options(raiseload("*"))
+)
+
+# Keyset page: the `limit` messages right before the (created_at, id) cursor
+_LIST_MESSAGES_BEFORE_STMT = _LIST_LATEST_MESSAGES_STMT.where(
+    tuple_(ChatMessage.created_at, ChatMessage.id_mensaje)
+    < tuple_(
+        bindparam("before", type_=DateTime(timezone=True)),
+        bindparam("before_id", type_=Integer),
+    )
+)
+
+
+async def list_messages(
+    db: AsyncSession,
+    conversation_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    before: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    latest: bool = False,
+) -> List[ChatMessage]:
+    """Get messages in a conversation, oldest first.
+
+    With ``latest`` the newest ``limit`` messages are returned. When the
+    (before, before_id) cursor of the oldest message already shown is given,
+    returns the page preceding it. Both use an index seek instead of OFFSET
+    and ignore ``skip``; otherwise falls back to skip/limit from the start.
+    """
+    if before is None or before_id is None:
+        if not latest:
+            result = await db.execute(
+                _LIST_MESSAGES_STMT,
+                {"conversation_id": conversation_id, "skip": skip, "limit": limit},
+            )
+            return result.scalars().all()
+        result = await db.execute(
+            _LIST_LATEST_MESSAGES_STMT,
+            {"conversation_id": conversation_id, "limit": limit},
+        )
+    else:
+        result = await db.execute(
+            _LIST_MESSAGES_BEFORE_STMT,
+            {
+                "conversation_id": conversation_id,
+                "before": before,
+                "before_id": before_id,
+                "limit": limit,
+            },
+        )
+    messages = result.scalars().all()
+    messages.reverse()
+    return messages
 
 
 async def create_message(
-    db: AsyncSession, conversation_id: int, sender_id: int, receiver_id: int, texto: str
+    db: AsyncSession,
+    conversation_id: int,
+    sender_id: int,
+    receiver_id: int,
+    texto: str,
 ) -> ChatMessage:
     """Create a new message in conversation"""
-    # Validate that sender and receiver are participants
-    conversation = await get_conversation(db, conversation_id)
-    if not conversation:
-        raise ValueError("Conversation not found")
-
-    participants = {conversation.id_admin, conversation.id_psicologo}
-    if sender_id not in participants or receiver_id not in participants:
-        raise ValueError("Sender or receiver not in conversation")
-
-    # Create message
-    message = ChatMessage(
-        id_conversacion=conversation_id,
-        id_sender=sender_id,
-        id_receiver=receiver_id,
-        texto=texto,
-    )
-    db.add(message)
+    # The conversation UPDATE and the message INSERT commit (or roll back)
+    # together as one transaction
+    try:
+        # Update conversation metadata and the receiver's unread counter. The
+        # WHERE clause doubles as the participant check: no row means the
+        # conversation does not exist or sender/receiver are not its participants.
+        receiver_is_admin = ChatConversation.id_admin == receiver_id
+        result = await db.execute(
+            update(ChatConversation)
+            .where(
+                ChatConversation.id_conversacion == conversation_id,
+                or_(
+                    and_(
+                        ChatConversation.id_admin == sender_id,
+                        ChatConversation.id_psicologo == receiver_id,
+                    ),
+                    and_(
+                        ChatConversation.id_admin == receiver_id,
+                        ChatConversation.id_psicologo == sender_id,
+                    ),
+                ),
+            )
+            .values(
+                unread_admin_count=ChatConversation.unread_admin_count
+                + case((receiver_is_admin, 1), else_=0),
+                unread_psicologo_count=ChatConversation.unread_psicologo_count
+                + case((receiver_is_admin, 0), else_=1),
+                # now() is the transaction start time: same value for both
+                # columns and for the message's created_at server default
+                updated_at=func.now(),
+                last_message_at=func.now(),
+                last_message_text=_message_preview(texto),
+            )
+            .returning(ChatConversation.id_conversacion)
+            .execution_options(synchronize_session=False)
+        )
+        if result.first() is None:
+            raise ValueError("Conversation not found or sender/receiver not in it")
 
-    # Update conversation metadata
-    conversation.updated_at = datetime.utcnow()
-    conversation.last_message_at = datetime.utcnow()
-    conversation.last_message_text = texto[:500] if len(texto) > 500 else texto
+        # Create message; RETURNING hands back id_mensaje/created_at without a refresh
+        result = await db.execute(
+            insert(ChatMessage)
+            .values(
+                id_conversacion=conversation_id,
+                id_sender=sender_id,
+                id_receiver=receiver_id,
+                texto=texto,
+            )
+            .returning(ChatMessage)
+        )
+        message = result.scalar_one()
 
-    await db.commit()
-    await db.refresh(message)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
 
     return message
 
 
 async def mark_messages_as_read(
-    db: AsyncSession, conversation_id: int, user_id: int
-) -> int:
-    """Mark all messages in conversation as read for user"""
-    from sqlalchemy import update
+    db: AsyncSession,
+    conversation_id: int,
+    user_id: int,
+    *,
+    conversation_cache: Optional[Dict[int, Optional[ChatConversation]]] = None,
+) -> List[int]:
+    """Mark all messages in conversation as read for user.
+
+    Returns the ids of the messages that were marked as read.
+    """
+    conversation = await get_conversation(
+        db, conversation_id, conversation_cache=conversation_cache
+    )
+    if not conversation:
+        return []
+
+    if user_id == conversation.id_admin:
+        unread_column = ChatConversation.unread_admin_count
+        unread_count = conversation.unread_admin_count
+    else:
+        unread_column = ChatConversation.unread_psicologo_count
+        unread_count = conversation.unread_psicologo_count
+    # Nothing unread: skip both UPDATEs (no row locks, no WAL writes). Safe only
+    # because the reset below runs under the conversation row lock, so the
+    # counter never drops below the real number of unread messages; a message
+    # racing past this read just stays counted for the next call.
+    if not unread_count:
+        return []
+
+    # Reset the user's unread counter first; keep updated_at so reading a
+    # conversation does not reorder the conversation list. This takes the
+    # conversation row lock, which create_message also takes before inserting,
+    # so a concurrent message is either committed (and marked read below) or
+    # waits for our commit and increments the counter afterwards.
+    reset = await db.execute(
+        update(ChatConversation)
+        .where(
+            ChatConversation.id_conversacion == conversation_id,
+            unread_column > 0,
+        )
+        .values(
+            {
+                unread_column: 0,
+                ChatConversation.updated_at: ChatConversation.updated_at,
+            }
+        )
+        .returning(ChatConversation.id_conversacion)
+        .execution_options(synchronize_session=False)
+    )
+    # Re-check against the locked row: another tab may have read it already
+    if reset.first() is None:
+        await db.rollback()
+        return []
 
     stmt = (
         update(ChatMessage)
@@ -192,17 +368,27 @@ async def mark_messages_as_read(
             )
         )
         .values(is_read=True)
+        .returning(ChatMessage.id_mensaje)
+        .execution_options(synchronize_session=False)
     )
     result = await db.execute(stmt)
+    message_ids = result.scalars().all()
+
     await db.commit()
-    return result.rowcount
+    if conversation_cache is not None:
+        conversation_cache.pop(conversation_id, None)
+    return message_ids
 
 
 async def get_conversation_participants(
     db: AsyncSession, conversation_id: int
 ) -> Optional[Tuple[int, int]]:
     """Get admin_id and psicologo_id for a conversation"""
-    conversation = await get_conversation(db, conversation_id)
-    if not conversation:
+    stmt = select(ChatConversation.id_admin, ChatConversation.id_psicologo).where(
+        ChatConversation.id_conversacion == conversation_id
+    )
+    result = await db.execute(stmt)
+    row = result.first()
+    if not row:
         return None
-    return (conversation.id_admin, conversation.id_psicologo)
+    return (row[0], row[1])
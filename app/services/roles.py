@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
+from app.core import role_cache
 from app.models.roles import Role
 
 
@@ -21,6 +22,7 @@ class RoleService:
         db.add(db_role)
         await db.commit()
         await db.refresh(db_role)
+        role_cache.clear()
         return db_role
 
     @staticmethod
@@ -29,4 +31,5 @@ class RoleService:
         if role:
             await db.delete(role)
             await db.commit()
+            role_cache.clear()
         return role
@@ -1,7 +1,8 @@
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-from jose import jwt
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 from app.core.config import settings
 
@@ -11,6 +12,10 @@ ACCESS_TOKEN_EXPIRE_MINUTES = settings.access_token_expire_minutes
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# token -> (user_id, exp); lets websocket reconnects skip re-verifying the JWT
+_TOKEN_CACHE_MAX = 1024
+_token_cache: Dict[str, Tuple[int, float]] = {}
+
 
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -26,3 +31,29 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+
+def decode_user_id(token: str) -> int:
+    """Return the user id (sub) of a valid access token.
+
+    Raises JWTError for invalid/expired tokens and ValueError/TypeError for a
+    malformed sub. Verified tokens are cached until their own expiry.
+    """
+    cached = _token_cache.get(token)
+    if cached:
+        if cached[1] > time.time():
+            return cached[0]
+        _token_cache.pop(token, None)
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    sub = payload.get("sub")
+    if sub is None:
+        raise JWTError("Missing sub")
+    user_id = int(sub)
+
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        if len(_token_cache) >= _TOKEN_CACHE_MAX:
+            _token_cache.clear()
+        _token_cache[token] = (user_id, float(exp))
+    return user_id
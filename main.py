@@ -21,8 +21,9 @@ from app.controllers.observaciones import router as observaciones_router
 from app.controllers.alertas import router as alertas_router
 from app.controllers.ws_notifications import router as ws_notifications_router
 from app.controllers.chat import router as chat_router
+from app.core import role_cache
 from app.models.roles import Role
-from fastapi.responses import RedirectResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 
 
 @asynccontextmanager
@@ -34,7 +35,9 @@ async def lifespan(_: FastAPI):
     yield
 
 
-app = FastAPI(title="AASMC API", lifespan=lifespan)
+app = FastAPI(
+    title="AASMC API", lifespan=lifespan, default_response_class=ORJSONResponse
+)
 
 app.include_router(roles_router, prefix="/roles", tags=["Roles"])
 app.include_router(users_router, prefix="/users", tags=["Usuarios"])
@@ -101,6 +104,7 @@ async def seed_roles(db: AsyncSession):
         if not rol:
             db.add(Role(nombre_rol=nombre))
     await db.commit()
+    role_cache.clear()
 
 
 if __name__ == "__main__":
@@ -108,7 +112,10 @@ if __name__ == "__main__":
     # Railway and similar platforms inject the PORT environment variable
     port = int(os.getenv("PORT", "8000"))
 
+    # Protocol-level websocket keepalive (control frames, no app-level pong)
+    ws_ping = {"ws_ping_interval": 20, "ws_ping_timeout": 20}
+
     if app_env == "production":
-        uvicorn.run("app.main:app", host="0.0.0.0", port=port)
+        uvicorn.run("app.main:app", host="0.0.0.0", port=port, **ws_ping)
     else:  # development
-        uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True)
+        uvicorn.run("app.main:app", host="0.0.0.0", port=port, reload=True, **ws_ping)